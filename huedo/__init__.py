@@ -1,28 +1,56 @@
-import argparse
-import json
-import platform
-import requests
-from typing import List
-from os.path import expanduser, isfile
-import yaml
+import os
+import pickle
+from contextlib import contextmanager
+from itertools import chain
+from typing import IO, TYPE_CHECKING, Iterable, Iterator, List, Optional, Sequence, Tuple
+from os.path import expanduser
 import sys
 
-from terminaltables import SingleTable
+if TYPE_CHECKING:
+    from threading import Event, Thread
 
+# orjson is considerably faster than the standard library's json, but is optional
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
 
-# silence insecure request warnings; these are generated because the hue bridge
-# uses https with a self-signed certificate
-requests.packages.urllib3.disable_warnings()
+# heavier dependencies (argparse, httpx, requests, yaml, terminaltables) are
+# imported where they're used, so that commands that don't need them start up quickly
+
+
+# set once insecure request warnings have been silenced
+_WARNINGS_DISABLED = False
 
 
 CONFIG_PATH = "~/.config/huedo.yaml"
+CONFIG_CACHE_PATH = "~/.config/huedo.yaml.cache.pkl"
+
+# the above, resolved once
+_CONFIG_FILE = expanduser(CONFIG_PATH)
+_CONFIG_CACHE_FILE = expanduser(CONFIG_CACHE_PATH)
+
+# the error type the bridge returns when its link button hasn't been pressed
+LINK_BUTTON_NOT_PRESSED = 101
+
+# seconds to wait between attempts to create a user while waiting for the link
+# button to be pressed; the final None means give up
+LINK_BUTTON_RETRY_DELAYS = (0.5, 1, 1, 2, 2, 4, 4, 8, 8, None)
 
 
-def print_table(data: List[List[str]], header=True) -> None:
+def print_table(data: Iterable[Sequence[str]], header=True) -> None:
     """
-    Prints a no-borders table with an optional header row
+    Prints a no-borders table with an optional header row.  If stdout isn't a
+    terminal, prints tab-separated rows as they're produced instead.
     """
-    tab = SingleTable(data)
+    if not sys.stdout.isatty():
+        for row in data:
+            print("\t".join(str(c) for c in row))
+        return
+
+    from terminaltables import SingleTable
+
+    tab = SingleTable(list(data))
     tab.inner_heading_row_border = header
     tab.inner_column_border = False
     tab.inner_row_border = False
@@ -35,6 +63,32 @@ class HueDoError(RuntimeError):
     pass
 
 
+class _ChunkReader:
+    """
+    Wraps an iterator of bytes in the read() interface ijson expects
+    """
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            data = self.buffer + b"".join(self.chunks)
+            self.buffer = b""
+            return data
+
+        # fill the buffer until it can satisfy the read or the chunks run out;
+        # read(0) must not consume anything, as ijson uses it to probe the type
+        while len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
 class HueDoConfig:
     def __init__(self):
         self.loaded = False
@@ -42,7 +96,7 @@ class HueDoConfig:
         self._load()
 
     def build_url(self, fragment):
-        return f"https://{self.config['hub']['ip']}/api/{self.config['hub']['user']}/{fragment}"
+        return self._base + fragment
 
     def get_lightgroup(self, group_name):
         if group_name in self.config["lightgroups"]:
@@ -50,29 +104,99 @@ class HueDoConfig:
 
         raise HueDoError(f"Unconfigured light group {group_name}")
 
+    def http2_enabled(self) -> bool:
+        """
+        Returns True if the config asks for requests to go over http/2
+        """
+        hub = self.config.get("hub") or {}
+        return bool(hub.get("http2", False))
+
     def update_user(self, hub_addr: str, user: str) -> None:
         """
         Saves the config with a new username
         """
         self.config['hub']['ip'] = hub_addr
         self.config['hub']['user'] = user
+        self._update_base()
         self._save()
 
     def _load(self):
-        if self.loaded:
-            return
+        self.config = self._read_config()
+        self.loaded = True
+        self._update_base()
 
-        if not isfile(expanduser(CONFIG_PATH)):
+    def _read_config(self) -> dict:
+        """
+        Returns the parsed config file, or an empty config if there isn't one
+        """
+        try:
+            f = open(_CONFIG_FILE)
+        except FileNotFoundError:
             # if unconfigured, that's fine
-            self.config = {"hub": {"ip": "", "user": ""}}
-            self.loaded = True
-            return
+            return {"hub": {"ip": "", "user": ""}}
+
+        with f:
+            st = os.fstat(f.fileno())
+            cache_key = (st.st_mtime_ns, st.st_size)
+
+            cached = self._load_cache(cache_key)
+            if cached is not None:
+                return cached
 
-        with open(expanduser(CONFIG_PATH)) as f:
             raw =  f.read()
 
-        self.config = yaml.safe_load(raw)
-        self.loaded = True
+        import yaml
+
+        # prefer the libyaml-backed loader when it's available
+        try:
+            from yaml import CSafeLoader as Loader
+        except ImportError:
+            from yaml import SafeLoader as Loader
+
+        config = yaml.load(raw, Loader=Loader)
+        self._save_cache(cache_key, config)
+        return config
+
+    def _update_base(self) -> None:
+        """
+        Recomputes the base url every request is built from; this must be
+        called whenever the hub config changes
+        """
+        hub = self.config.get("hub") or {}
+        self._base = f"https://{hub.get('ip', '')}/api/{hub.get('user', '')}/"
+
+    def _load_cache(self, cache_key: Tuple[int, int]) -> Optional[dict]:
+        """
+        Returns the parsed config from the cache file if it was written for a
+        config file with the given (mtime, size) key, otherwise returns None
+        """
+        try:
+            with open(_CONFIG_CACHE_FILE, "rb") as f:
+                cached_key, config = pickle.load(f)
+        except Exception:
+            # a missing or unreadable cache just means we parse the yaml
+            return None
+
+        if cached_key != cache_key:
+            return None
+
+        return config
+
+    def _save_cache(self, cache_key: Tuple[int, int], config: dict) -> None:
+        """
+        Writes the parsed config out to the cache file, keyed by the (mtime,
+        size) of the config file it was parsed from
+        """
+        try:
+            # the config holds the bridge credentials, so keep the cache private
+            fd = os.open(_CONFIG_CACHE_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            # the mode above only applies to new files; tighten existing ones too
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((cache_key, config), f)
+        except OSError:
+            # the cache is only an optimization
+            pass
 
     def _save(self) -> None:
         """
@@ -81,48 +205,215 @@ class HueDoConfig:
         if not self.loaded:
             raise HueDoError("Attempted to save config before it was loaded!")
 
+        import yaml
+
+        # prefer the libyaml-backed dumper when it's available
+        try:
+            from yaml import CSafeDumper as Dumper
+        except ImportError:
+            from yaml import SafeDumper as Dumper
+
         print(f"Writing new config {self.config}")
 
-        with open(expanduser(CONFIG_PATH), "w") as f:
-            f.write(yaml.dump(self.config))
+        with open(_CONFIG_FILE, "w") as f:
+            f.write(yaml.dump(self.config, Dumper=Dumper))
+
+
+# the config shared by every client in this process; see get_config
+_CONFIG_SINGLETON = None
+
+
+def get_config() -> HueDoConfig:
+    """
+    Returns the process-wide config, loading it the first time it's needed
+    """
+    global _CONFIG_SINGLETON
+    if _CONFIG_SINGLETON is None:
+        _CONFIG_SINGLETON = HueDoConfig()
+
+    return _CONFIG_SINGLETON
 
 
 class HueDoClient:
     def __init__(self):
-        self.config = HueDoConfig()
+        self.config = get_config()
+
+        # which http stack the session below is built on; http/2 (and so httpx)
+        # is opt-in through the config
+        self.http2 = self.config.http2_enabled()
+        self.session = self._build_session()
+
+    def _build_session(self):
+        """
+        Returns the client every request to the bridge is sent through.  A
+        single client lets every call reuse the same connection to the bridge,
+        rather than doing a new TLS handshake per request.
+
+        These certs won't verify, but it's a hue bridge on the local network,
+        so don't worry about it.
+        """
+        if self.http2:
+            return self._build_http2_client()
+
+        import requests
+        from requests.adapters import HTTPAdapter
+        from requests.packages.urllib3.util.retry import Retry
+
+        global _WARNINGS_DISABLED
+        if not _WARNINGS_DISABLED:
+            # silence insecure request warnings; these are generated because the
+            # hue bridge uses https with a self-signed certificate
+            requests.packages.urllib3.disable_warnings()
+            _WARNINGS_DISABLED = True
+
+        session = requests.Session()
+        session.verify = False
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504]),
+        )
+        session.mount("https://", adapter)
+
+        return session
+
+    def _build_http2_client(self):
+        """
+        Returns an httpx client that speaks http/2 to the bridge, so concurrent
+        requests share a single connection.  If the bridge doesn't speak it,
+        httpx falls back to http/1.1 keep-alive.
+        """
+        try:
+            import httpx
+
+            # httpx only retries failed connections, not error responses
+            transport = httpx.HTTPTransport(
+                http2=True,
+                verify=False,
+                retries=2,
+                # enough connections for every toggle worker if we end up on http/1.1
+                limits=httpx.Limits(max_connections=8),
+            )
+        except ImportError:
+            # httpx, or the h2 package its http/2 support needs, isn't installed
+            raise HueDoError("http2 is enabled in the config, but httpx[http2] isn't installed; install huedo[http2]")
+
+        return httpx.Client(transport=transport)
+
+    def start_keepalive(self, interval: int = 30, stop: Optional["Event"] = None) -> "Thread":
+        """
+        Starts a daemon thread that makes a cheap request to the bridge every
+        interval seconds, so that a long-running process always has a warm
+        connection ready instead of paying for a new handshake after the bridge
+        times out an idle one.  The thread exits once stop is set, if given.
+        Returns the started thread.
+        """
+        import threading
+
+        if stop is None:
+            stop = threading.Event()
+
+        url = self.config.build_url("config")
+
+        def ping():
+            while not stop.is_set():
+                try:
+                    self.session.get(url, timeout=2)
+                except Exception:
+                    # this is best-effort; the next real request will reconnect
+                    pass
+                stop.wait(interval)
+
+        thread = threading.Thread(target=ping, name="huedo-keepalive", daemon=True)
+        thread.start()
+        return thread
 
     def create_user(self, hub_addr: str) -> None:
         """
-        Sets up a new user with the hue hub.  The hue link button must have been
-        pressed before this call will work.
+        Sets up a new user with the hue hub.  The hue link button must be
+        pressed for this call to work; if it hasn't been pressed yet, this keeps
+        retrying for about 30 seconds to give the user a chance to press it.
         """
-        res = self.call("POST", "", body={"devicetype":f"huedo#{platform.system()}"}, url=f"https://{hub_addr}/api")
+        import platform
+        import time
+
+        prompted = False
+
+        for delay in LINK_BUTTON_RETRY_DELAYS:
+            res = self.call("POST", "", body={"devicetype":f"huedo#{platform.system()}"}, url=f"https://{hub_addr}/api")
+
+            if not (isinstance(res, list) and "error" in res[0]):
+                break
+
+            if res[0]["error"].get("type") != LINK_BUTTON_NOT_PRESSED or delay is None:
+                # either something else went wrong, or we're out of retries
+                raise HueDoError(res[0]["error"]["description"])
+
+            if not prompted:
+                print("Press the link button on the hub; waiting for it to be pressed...")
+                prompted = True
+
+            time.sleep(delay)
 
         if isinstance(res, list) and "success" in res[0]:
             # got a new username - sweet!
             username = res[0]['success']['username']
 
             self.config.update_user(hub_addr, username)
-        elif isinstance(res, list) and "error" in res[0]:
-            raise HueDoError(res[0]["error"]["description"])
         else:
             raise HueDoError(f"Unexpected response: {res}")
 
-
     def toggle_lightgroup(self, group_name: str) -> None:
         """
         Toggles all lights in the group.  Group names are set up in the config
         """
         group = self.config.get_lightgroup(group_name)
-        for light in group["lights"]:
-            self.toggle_light(light)
 
-    def toggle_light(self, light: int) -> None:
+        if "group_id" in group:
+            # the bridge knows about this group, so let it toggle every light
+            # in a single request
+            group_id = group["group_id"]
+            resp = self.call("GET", f"groups/{group_id}")
+            new_state = not resp["state"]["any_on"]
+            self.call("PUT", f"groups/{group_id}/action", body={"on":new_state})
+            return
+
+        lights = group["lights"]
+        if not lights:
+            return
+
+        # fetch the state of every light at once instead of one at a time
+        snapshot = self._snapshot_lights()
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        # these requests are independent, so send them concurrently; the
+        # session's connections are shared between the workers
+        with ThreadPoolExecutor(max_workers=min(8, len(lights))) as ex:
+            list(ex.map(
+                lambda l: self.toggle_light(l, current_state=snapshot[str(l)]),
+                lights,
+            ))
+
+    def toggle_light(self, light: int, current_state: bool = None) -> None:
+        """
+        Toggles the state of a single light.  If the light's current on state is
+        already known, pass it as current_state to skip looking it up.
+        """
+        if current_state is None:
+            current_state = self.light_is_on(light)
+
+        self.call("PUT", f"lights/{light}/state", body={"on":not current_state})
+
+    def _snapshot_lights(self) -> dict:
         """
-        Toggles the state of a single light
+        Returns the on state of every light, keyed by light id, fetched in a
+        single request
         """
-        new_state = not self.light_is_on(light)
-        self.call("PUT", f"lights/{light}/state", body={"on":new_state})
+        return {
+            lid: light["state"]["on"]
+            for lid, light in self.get_lights().items()
+        }
 
     def light_is_on(self, light: int) -> bool:
         """
@@ -137,6 +428,25 @@ class HueDoClient:
         """
         return self.call("GET", "lights")
 
+    def get_lights_summary(self) -> Iterator[Tuple[str, str]]:
+        """
+        Yields the id and name of every light.  If ijson is installed, the
+        response is decoded as it arrives rather than all at once.
+        """
+        try:
+            import ijson
+        except ImportError:
+            for lid, light in self.get_lights().items():
+                yield lid, light["name"]
+            return
+
+        with self._stream("lights") as f:
+            try:
+                for lid, light in ijson.kvitems(f, ""):
+                    yield lid, light["name"]
+            except ijson.JSONError as e:
+                raise HueDoError(f"Got invalid JSON from the bridge: {e}")
+
     def get_light_info(self, light: int) -> dict:
         """
         Returns information about a single light
@@ -174,84 +484,166 @@ class HueDoClient:
         print(f"Settings {light_id} to state {state}")
         self.call("PUT", f"lights/{light_id}/state", body=state)
 
-    def call(self, method: str, fragment: str, body: dict = {}, url: str = None) -> dict:
-        func = getattr(requests, method.lower())
+    @contextmanager
+    def _stream(self, fragment: str) -> Iterator[IO[bytes]]:
+        """
+        GETs the fragment and provides the response body as a file-like object
+        that's read as it arrives
+        """
+        url = self.config.build_url(fragment)
+
+        if self.http2:
+            with self.session.stream("GET", url) as r:
+                if r.status_code != 200:
+                    raise HueDoError(f"Got unexpected response code {r.status_code}: {r.read()}")
 
+                yield _ChunkReader(r.iter_bytes())
+            return
+
+        with self.session.get(url, stream=True) as r:
+            if r.status_code != 200:
+                raise HueDoError(f"Got unexpected response code {r.status_code}: {r.content}")
+
+            r.raw.decode_content = True
+            yield r.raw
+
+    def call(self, method: str, fragment: str, body: dict = {}, url: str = None) -> dict:
         if url is None:
             url = self.config.build_url(fragment)
 
-        body_json = None
-        if body:
-            body_json = json.dumps(body)
-
-        # these certs won't verify, but it's a hue bridge on the local network,
-        # so don't worry about it
-        r = func(url, data=body_json, verify=False)
+        r = self.session.request(method, url, json=body or None)
 
         if r.status_code != 200:
             raise HueDoError(f"Got unexpected response code {r.status_code}: {r.content}")
 
-        return r.json()
+        return _json.loads(r.content)
+
+
+def _positional_args(unparsed: List[str], help_text: str, required: int, optional: int = 0) -> List[Optional[str]]:
+    """
+    Handles the arguments of commands that only take positional arguments
+    without the cost of building an argparse parser.  Prints help_text and exits
+    if help was asked for, or prints its usage line and exits if an option or
+    the wrong number of arguments was given.  Returns required + optional
+    arguments, with missing optional arguments as None.
+    """
+    if "-h" in unparsed or "--help" in unparsed:
+        print(help_text)
+        sys.exit(0)
+
+    # these commands don't take any options, so anything that looks like one
+    # is an error rather than a positional value
+    options = [arg for arg in unparsed if arg.startswith("-")]
+
+    error = None
+    if options:
+        error = f"unrecognized arguments: {' '.join(options)}"
+    elif not required <= len(unparsed) <= required + optional:
+        error = "wrong number of arguments"
+
+    if error:
+        usage = help_text.splitlines()[0]
+        prog = " ".join(usage.split()[1:3])
+        print(usage, file=sys.stderr)
+        print(f"{prog}: error: {error}", file=sys.stderr)
+        sys.exit(2)
+
+    return unparsed + [None] * (required + optional - len(unparsed))
+
+
+_INIT_HELP = """usage: huedo init HUB_IP
+
+Initialize a new huedo installation
+
+positional arguments:
+  HUB_IP      The IP Address the Hue Hub is reachable at (you can find it in the Phillips Hue app).
+
+options:
+  -h, --help  show this help message and exit"""
 
 
 def init_user(unparsed: List[str]) -> None:
     """
     Sets up huedo with a new user from the hub
     """
-    parser = argparse.ArgumentParser("huedo init", description="Initialize a new huedo installation")
-    parser.add_argument("hub_ip", metavar="HUB_IP", help="The IP Address the Hue Hub is reachable at (you can find it in the Phillips Hue app).")
-    args = parser.parse_args(unparsed)
+    hub_ip, = _positional_args(unparsed, _INIT_HELP, 1)
 
     client = HueDoClient()
-    client.create_user(args.hub_ip)
+    client.create_user(hub_ip)
 
 
-def toggle_lightgroup(unparsed: List[str]) -> None:
-    parser = argparse.ArgumentParser("huedo toggle", description="Toggle light status")
-    parser.add_argument("light_group", metavar="IDENTIFIER", help="The Light ID or Light Group name")
-    args = parser.parse_args(unparsed)
+_TOGGLE_HELP = """usage: huedo toggle IDENTIFIER
+
+Toggle light status
+
+positional arguments:
+  IDENTIFIER  The Light ID or Light Group name
 
+options:
+  -h, --help  show this help message and exit"""
+
+
+def toggle_lightgroup(unparsed: List[str]) -> None:
+    light_group, = _positional_args(unparsed, _TOGGLE_HELP, 1)
 
     client = HueDoClient()
 
     try:
-        light_id = int(args.light_group)
+        light_id = int(light_group)
         client.toggle_light(light_id)
     except ValueError:
         # it wasn't a light id
-        client.toggle_lightgroup(args.light_group)
+        client.toggle_lightgroup(light_group)
 
 
-def list_things(unparsed: List[str]) -> None:
-    thing_types = ("lights",)
+# the entity types that can be listed, and their help string
+_THINGS = ("lights",)
+_THINGS_HELP = ", ".join(_THINGS)
 
-    parser = argparse.ArgumentParser("huedo list", description="List objects within the Hue ecosystem")
-    parser.add_argument("thing", metavar="TYPE", help=f"The entity type to list; one of {', '.join(thing_types)}")
-    args = parser.parse_args(unparsed)
+_LIST_HELP = f"""usage: huedo list TYPE
+
+List objects within the Hue ecosystem
+
+positional arguments:
+  TYPE        The entity type to list; one of {_THINGS_HELP}
+
+options:
+  -h, --help  show this help message and exit"""
+
+
+def list_things(unparsed: List[str]) -> None:
+    thing, = _positional_args(unparsed, _LIST_HELP, 1)
 
     client = HueDoClient()
 
-    if args.thing not in thing_types:
+    if thing not in _THINGS:
         print(f"Unrecognized thing: {thing}")
         sys.exit(1)
 
-    if args.thing == "lights":
-        lights = client.get_lights()
-
-        data = [["ID", "Name"]] + [[lid, light['name']] for lid, light in lights.items()]
+    if thing == "lights":
+        data = chain([("ID", "Name")], client.get_lights_summary())
         print_table(data)
 
 
+_SHOW_HELP = """usage: huedo show IDENTIFIER
+
+Show details on a light
+
+positional arguments:
+  IDENTIFIER  The Light ID of the light to show
+
+options:
+  -h, --help  show this help message and exit"""
+
+
 def show_light_details(unparsed: List[str]) -> None:
     """
     Shows the details of a single light
     """
-    parser = argparse.ArgumentParser("huedo show", description="Show details on a light")
-    parser.add_argument("light_id", metavar="IDENTIFIER", help="The Light ID of the light to show")
-    args = parser.parse_args(unparsed)
+    light_id, = _positional_args(unparsed, _SHOW_HELP, 1)
 
     client = HueDoClient()
-    light = client.get_light_info(args.light_id)
+    light = client.get_light_info(light_id)
 
     data = [
         [ "Name:", light['name'] ],
@@ -269,6 +661,8 @@ def set_light_state(unparsed: List[str]) -> None:
     """
     Sets the current state of a single light
     """
+    import argparse
+
     parser = argparse.ArgumentParser("huedo set", description="Configure light settings")
     parser.add_argument("light_id", metavar="IDENTIFIER", help="The Light ID to operate on")
     parser.add_argument("--state", metavar="STATE", help="The state to set; 'on' or 'off'")
@@ -291,31 +685,45 @@ def set_light_state(unparsed: List[str]) -> None:
     )
 
 
+_RAW_HELP = """usage: huedo raw FRAGMENT [METHOD] [BODY]
+
+Send raw requests to the Hue Hub
+
+positional arguments:
+  FRAGMENT    The path fragment to send a request to, not including base URL
+  METHOD      The request method; defaults to GET
+  BODY        The request body to send as JSON; defaults to an empty JSON object
+
+options:
+  -h, --help  show this help message and exit"""
+
+
 def raw(unparsed: List[str]) -> None:
     """
     Handles sending requests directly to the bridge.
     Accepts the fragment, JSON body, and method (default
     GET) and prints out the JSON response.
     """
-    parser = argparse.ArgumentParser("huedo raw", description="Send raw requests to the Hue Hub")
-    parser.add_argument("fragment", metavar="FRAGMENT", help="The path fragment to send a request to, not including base URL")
-    parser.add_argument("method", metavar="METHOD", nargs="?", default="GET", help="The request method; defaults to GET")
-    parser.add_argument("body", nargs="?", metavar="BODY", default=None, help="The request body to send as JSON; defaults to an empty JSON object")
-    args = parser.parse_args(unparsed)
+    fragment, method, raw_body = _positional_args(unparsed, _RAW_HELP, 1, optional=2)
 
     body = None
 
-    if args.body:
+    if raw_body:
         try:
-            body = json.loads(args.body)
-        except JSONDecodeError:
+            body = _json.loads(raw_body)
+        except _json.JSONDecodeError:
             print("Body specified must be valid JSON!")
             exit(1)
 
     client = HueDoClient()
-    res = client.call(args.method, args.fragment, body)
+    res = client.call(method or "GET", fragment, body)
 
-    print(json.dumps(res))
+    out = _json.dumps(res)
+    if isinstance(out, bytes):
+        # orjson serializes to bytes
+        out = out.decode()
+
+    print(out)
 
 DISPATCH_TABLE = {
     "init": init_user,
@@ -326,10 +734,33 @@ DISPATCH_TABLE = {
     "raw": raw,
 }
 
+_COMMANDS_HELP = ", ".join(DISPATCH_TABLE)
 
 def main():
+    args = sys.argv[1:]
+
+    if args and args[0] in DISPATCH_TABLE:
+        # each command handles its own arguments, including --help
+        command, unparsed = args[0], args[1:]
+    else:
+        command, unparsed = _parse_command()
+
+    try:
+        DISPATCH_TABLE[command](unparsed)
+    except HueDoError as e:
+        print(f"Error: {e}")
+
+
+def _parse_command():
+    """
+    Parses the command out of sys.argv with argparse, for when it isn't simply
+    the first argument; this handles help and invalid commands.  Returns the
+    command and the arguments left for it to parse.
+    """
+    import argparse
+
     parser = argparse.ArgumentParser("huedo", description="Interact with a Phillips Hue Hub", add_help=False)
-    parser.add_argument("command", metavar="COMMAND", help=f"The command to run - see the --help for each command for more information", choices=list(DISPATCH_TABLE.keys()), nargs="?")
+    parser.add_argument("command", metavar="COMMAND", help=f"The command to run; one of {_COMMANDS_HELP} - see the --help for each command for more information", choices=DISPATCH_TABLE, nargs="?")
     parser.add_argument("--help", action="store_true", help="Show help and exit")
     parsed, unparsed = parser.parse_known_args()
 
@@ -339,7 +770,4 @@ def main():
     elif parsed.help:
         unparsed.append("--help")
 
-    try:
-        DISPATCH_TABLE[parsed.command](unparsed)
-    except HueDoError as e:
-        print(f"Error: {e}")
+    return parsed.command, unparsed
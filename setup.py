@@ -15,10 +15,19 @@ setup(
         "requests",
         "PyYAML",
     ],
-    entry_points={
-        "console_scripts": [
-            "huedo = huedo:main",
-        ]
+    extras_require={
+        "fast": [
+            "orjson",
+            "ijson",
+        ],
+        "http2": [
+            "httpx[http2]",
+        ],
     },
+    # a plain script starts faster than a console_scripts entry point, whose
+    # generated wrapper may import pkg_resources
+    scripts=[
+        "bin/huedo",
+    ],
     python_requires=">=3.6",
 )